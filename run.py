@@ -8,7 +8,7 @@ def main():
 
     Returns
     -------
-    df: pandas.DataFrame
+    df: polars.DataFrame
         DataFrame of number of service stops and
         punctuality rate by user-selected geography.
 
@@ -2,19 +2,54 @@
 from src.bus_metrics.setup.ingest_static_data import StaticDataIngest
 from src.bus_metrics.setup.ingest_realtime_data import RealtimeDataIngest
 from src.bus_metrics.setup.build_lookup import create
+from src.bus_metrics.setup.ingest_config import load_ingest_toml
 
 # from src.bus_metrics.aggregation.build_schedules import Schedule_Builder
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+import asyncio
 import logging
 import os
-import toml
-import time
 
-sTool = StaticDataIngest()
-rTool = RealtimeDataIngest()
-ingest_toml = toml.load("src/bus_metrics/setup/ingest.toml")
-scriptStartTime = datetime.now()
-scriptStartTimeUnix = time.mktime(scriptStartTime.timetuple())
+
+async def poll_realtime(
+    rTool: RealtimeDataIngest, duration: int = 60, interval: int = 10
+) -> None:
+    """Poll BODS on a fixed tick, parsing each return in the background.
+
+    Each API call runs on a worker thread and its parse is scheduled as
+    a background task, so parsing overlaps with the next call. Ticks
+    are measured on the event loop's monotonic clock to avoid drift.
+
+    Parameters
+    ----------
+    rTool: RealtimeDataIngest
+        Realtime ingest tool instance
+    duration: int
+        Number of seconds to poll for
+    interval: int
+        Number of seconds between API calls
+
+    """
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time()
+    end = next_tick + duration
+    parsing = []
+
+    try:
+        while next_tick < end:
+            message = await asyncio.to_thread(rTool.api_call)
+            parsing.append(
+                asyncio.create_task(
+                    asyncio.to_thread(rTool.parse_realtime, message=message)
+                )
+            )
+            next_tick += interval
+            await asyncio.sleep(max(0, next_tick - loop.time()))
+    finally:
+        await asyncio.gather(*parsing)
+
+    return None
 
 
 def data_folder(logger: logging.Logger) -> None:
@@ -38,7 +73,8 @@ def data_folder(logger: logging.Logger) -> None:
     return None
 
 
-if __name__ == "__main__":  # noqa: C901
+def main():  # noqa: C901
+    """Ingest all project resources and build lookup table."""
     session_name = f"ingest_{format(datetime.now(), '%Y_%m_%d_%H:%M')}"
     logger = logging.getLogger(__name__)
     log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -51,45 +87,36 @@ if __name__ == "__main__":  # noqa: C901
 
     data_folder(logger=logger)
 
-    try:
-        logger.info("Importing NAPTAN stops data")
-        sTool.import_stops_from_naptan()
-    except Exception as e:
-        logger.warning(f"Bypassed: {e}")
-        pass
-
-    try:
-        logger.info("Importing boundaries data")
-        sTool.ingest_data_from_geoportal()
-    except Exception as e:
-        logger.warning(f"Bypassed: {e}")
-        pass
-
-    try:
-        logger.info("Importing bus timetable data")
-        sTool.ingest_bus_timetable()
-    except Exception as e:
-        logger.warning(f"Bypassed: {e}")
-        pass
+    sTool = StaticDataIngest()
+    rTool = RealtimeDataIngest()
+    ingest_toml = load_ingest_toml()
+
+    # independent, network-bound downloads run concurrently
+    static_ingests = {
+        "NAPTAN stops data": sTool.import_stops_from_naptan,
+        "boundaries data": sTool.ingest_data_from_geoportal,
+        "bus timetable data": sTool.ingest_bus_timetable,
+    }
+    with ThreadPoolExecutor(max_workers=len(static_ingests)) as executor:
+        futures = {}
+        for resource, ingest in static_ingests.items():
+            logger.info(f"Importing {resource}")
+            futures[executor.submit(ingest)] = resource
+
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                logger.warning(f"Bypassed {futures[future]}: {e}")
 
     if ingest_toml["download_realtime_sample"]:
 
-        scriptStartTime = datetime.now()
-        scriptStartTimeUnix = time.mktime(scriptStartTime.timetuple())
-
-        # TODO: more articulate ways of triggering every 10 seconds
-        while (
-            time.mktime(datetime.now().timetuple()) < scriptStartTimeUnix + 60
-        ):
-            try:
-                logger.info("Importing example realtime data")
-                rTool.api_call()
-                rTool.parse_realtime()
-                time.sleep(10)
-            except Exception as e:
-                logger.warning(f"Broken: {e}")
-                logger.warning("##Recommend checking your API key first")
-                break
+        try:
+            logger.info("Importing example realtime data")
+            asyncio.run(poll_realtime(rTool))
+        except Exception as e:
+            logger.warning(f"Broken: {e}")
+            logger.warning("##Recommend checking your API key first")
     else:
         logger.warning("##Realtime download bypassed##")
         logger.warning("##Amend toml to download sample##")
@@ -98,7 +125,7 @@ if __name__ == "__main__":  # noqa: C901
     try:
         logger.info("Building stops-geography lookup table")
         # TODO: naming/access of function to be improved
-        create()
+        create(config=ingest_toml)
     except Exception as e:
         logger.warning(f"Build error: {e}")
         pass
@@ -116,3 +143,7 @@ if __name__ == "__main__":  # noqa: C901
     logger.info("-----------------------------")
     logger.info("-------SETUP COMPLETED-------")
     logger.info("-----------------------------")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,87 @@
 """Class to create a region wide stops reliability metric."""
 
 from datetime import datetime
+import glob
+import hashlib
 import logging
 import toml
 import os
-import glob
+import zipfile
 from src.bus_metrics.aggregation.preprocessing import (
     build_stops,
+    build_uid,
     convert_SINGLE_datetime_to_unix,
-    polars_robust_load_csv,
-    unzip_GTFS,
     convert_string_time_to_unix,
+    find_GTFS_zip,
+    polars_load_csv_with_schema,
+    polars_robust_scan_csv,
 )
 import polars as pl
 import argparse
 
+# GTFS column types, declared up front to skip dtype inference
+CALENDAR_SCHEMA = {
+    "service_id": pl.Utf8,
+    "monday": pl.UInt8,
+    "tuesday": pl.UInt8,
+    "wednesday": pl.UInt8,
+    "thursday": pl.UInt8,
+    "friday": pl.UInt8,
+    "saturday": pl.UInt8,
+    "sunday": pl.UInt8,
+    "start_date": pl.Utf8,
+    "end_date": pl.Utf8,
+}
+CALENDAR_DATES_SCHEMA = {
+    "service_id": pl.Utf8,
+    "date": pl.Utf8,
+    "exception_type": pl.UInt8,
+}
+ROUTES_SCHEMA = {
+    "route_id": pl.Utf8,
+    "agency_id": pl.Utf8,
+    "route_short_name": pl.Utf8,
+    "route_long_name": pl.Utf8,
+    "route_type": pl.Int32,
+}
+STOP_TIMES_SCHEMA = {
+    "trip_id": pl.Utf8,
+    "arrival_time": pl.Utf8,
+    "departure_time": pl.Utf8,
+    "stop_id": pl.Utf8,
+    "stop_sequence": pl.UInt32,
+    "stop_headsign": pl.Utf8,
+    "pickup_type": pl.UInt8,
+    "drop_off_type": pl.UInt8,
+    "shape_dist_traveled": pl.Float64,
+    "timepoint": pl.UInt8,
+}
+TRIPS_SCHEMA = {
+    "route_id": pl.Utf8,
+    "service_id": pl.Utf8,
+    "trip_id": pl.Utf8,
+    "trip_headsign": pl.Utf8,
+    "direction_id": pl.UInt8,
+    "block_id": pl.Utf8,
+    "shape_id": pl.Utf8,
+    "wheelchair_accessible": pl.UInt8,
+    "vehicle_journey_code": pl.Utf8,
+}
+
+# columns written by RealtimeDataIngest.parse_realtime
+REALTIME_SCHEMA = {
+    "time_ingest": pl.Int64,
+    "time_transpond": pl.Int64,
+    "bus_id": pl.Utf8,
+    "trip_id": pl.Utf8,
+    "route_id": pl.Utf8,
+    "current_stop": pl.Int64,
+    "latitude": pl.Float64,
+    "longitude": pl.Float64,
+    "bearing": pl.Float64,
+    "journey_date": pl.Int64,
+}
+
 
 class Schedule_Builder:
     """Class to load data and create metrics.
@@ -64,6 +131,7 @@ class Schedule_Builder:
         self.output_unlabelled_bulk = output_unlabelled_bulk
         self.logger = logger
         self.timetable_dir = "data/timetable"
+        self.timetable_cache_dir = "data/timetable_cache"
         self.realtime_dir = "data/realtime"
 
     def load_raw_timetable_data(
@@ -71,12 +139,13 @@ class Schedule_Builder:
         stops: pl.DataFrame,
         region: str = None,
         date: str = None,
-    ) -> pl.DataFrame:
+    ) -> pl.LazyFrame:
         """Load timetable data.
 
         Collect and concatenates all timetable data for specified
         day, returning all individual service stops (every 'bus
-        at stop' activity) for the day.
+        at stop' activity) for the day. Categorical columns must be
+        collected under a `polars.StringCache`.
 
         Parameters
         ----------
@@ -89,8 +158,9 @@ class Schedule_Builder:
 
         Returns
         -------
-        service_stops : polars.DataFrame
-            All service stops.
+        service_stops : polars.LazyFrame
+            All service stops, with trip_id, route_id and stop_id
+            as categoricals.
 
         """
         if region is None:
@@ -102,50 +172,86 @@ class Schedule_Builder:
         weekday = datetime.strptime(date, "%Y%m%d").strftime("%A").lower()
         from_dir = self.timetable_dir
 
-        unzip_GTFS(
-            txt_path=from_dir,
+        zip_file = find_GTFS_zip(
             zip_path=from_dir,
             file_name_pattern=f"{region}_{date}.zip",
             logger=self.logger,
         )
 
-        calendar_dates = pl.read_csv(
-            f"{from_dir}/calendar_dates.txt", ignore_errors=True
+        # read GTFS members straight from the archive, in memory
+        with zipfile.ZipFile(zip_file, "r") as gtfs:
+            calendar_dates = polars_load_csv_with_schema(
+                gtfs.read("calendar_dates.txt"), CALENDAR_DATES_SCHEMA
+            ).lazy()
+            calendar = polars_load_csv_with_schema(
+                gtfs.read("calendar.txt"), CALENDAR_SCHEMA
+            ).lazy()
+            # only parse the columns the service stops are built from
+            routes = polars_load_csv_with_schema(
+                gtfs.read("routes.txt"),
+                ROUTES_SCHEMA,
+                columns=["route_id", "route_type"],
+            ).lazy()
+            stop_times = polars_load_csv_with_schema(
+                gtfs.read("stop_times.txt"),
+                STOP_TIMES_SCHEMA,
+                columns=[
+                    "trip_id",
+                    "arrival_time",
+                    "stop_id",
+                    "stop_sequence",
+                ],
+            ).lazy()
+            trips = polars_load_csv_with_schema(
+                gtfs.read("trips.txt"),
+                TRIPS_SCHEMA,
+                columns=["route_id", "service_id", "trip_id"],
+            ).lazy()
+
+        # dictionary-encode join keys; categories are shared via the
+        # global string cache enabled around collect
+        trips = trips.with_columns(
+            pl.col(["trip_id", "route_id"]).cast(pl.Categorical)
         )
-        calendar = pl.read_csv(f"{from_dir}/calendar.txt", ignore_errors=True)
-        routes = polars_robust_load_csv(
-            f"{from_dir}/routes.txt", dtypes={"route_id": pl.Utf8}
+        stop_times = stop_times.with_columns(
+            pl.col(["trip_id", "stop_id"]).cast(pl.Categorical)
         )
-        stop_times = polars_robust_load_csv(
-            f"{from_dir}/stop_times.txt",
-            dtypes={"stop_id": pl.Utf8},
+        routes = routes.with_columns(pl.col("route_id").cast(pl.Categorical))
+        stops = stops.lazy().with_columns(
+            pl.col("stop_id").cast(pl.Categorical)
         )
 
-        trips = polars_robust_load_csv(
-            f"{from_dir}/trips.txt", dtypes={"route_id": pl.Utf8}
+        # unix arrival time computed on stop_times so time window
+        # filters are pushed below the joins
+        stop_times = convert_string_time_to_unix(
+            stop_times, "arrival_time", date=date
         )
-
-        calendar_dates = calendar_dates.filter(
-            pl.col("date").cast(pl.Utf8) == date
+        # drop all times beyond 24 hour clock
+        # TODO: can these be handled better?
+        next_midnight = convert_SINGLE_datetime_to_unix(date=date) + 86400
+        stop_times = stop_times.filter(
+            pl.col("unix_arrival_time") < pl.lit(next_midnight, pl.Int64)
         )
+
+        calendar_dates = calendar_dates.filter(pl.col("date") == date)
         exception_drops = calendar_dates.filter(
             pl.col("exception_type") == 2
-        ).select(  # noqa: E501
-            pl.col("service_id")
-        )
-        exception_adds = calendar_dates.filter(pl.col("exception_type") == 1)[
-            "service_id"
-        ].to_list()
+        ).select("service_id")
+        exception_adds = calendar_dates.filter(
+            pl.col("exception_type") == 1
+        ).select("service_id")
 
         # filter routes to required route_type(s)
         routes = routes.filter(pl.col("route_type").is_in(self.route_types))
 
         # filter to today's activity plus added exceptions
-        active_services = calendar.filter(pl.col(weekday) == 1)[
-            "service_id"
-        ].to_list()
-        active_services.extend(exception_adds)
-        trips = trips.filter(pl.col("service_id").is_in(active_services))
+        active_services = pl.concat(
+            [
+                calendar.filter(pl.col(weekday) == 1).select("service_id"),
+                exception_adds,
+            ]
+        )
+        trips = trips.join(active_services, on="service_id", how="semi")
         trips = trips.join(exception_drops, on="service_id", how="anti")
 
         # drop cancelled services
@@ -164,19 +270,10 @@ class Schedule_Builder:
         service_stops = service_stops.with_columns(
             pl.lit(date).alias("timetable_date")
         )
-        # drop all times beyond 24 hour clock
-        # TODO: can these be handled better?
-        service_stops = service_stops.filter(
-            pl.col("arrival_time").str.slice(0, 2).cast(pl.UInt32) < 24
-        )
-
-        service_stops = convert_string_time_to_unix(
-            service_stops, "arrival_time"
-        )
 
         return service_stops
 
-    def load_raw_realtime_data(self, region=None, date=None) -> pl.DataFrame:
+    def load_raw_realtime_data(self, region=None, date=None) -> pl.LazyFrame:
         """Collect all realtime data for individual day.
 
         Parameters
@@ -188,7 +285,7 @@ class Schedule_Builder:
 
         Returns
         -------
-        df : polars.DataFrame
+        lf : polars.LazyFrame
             Unprocessed realtime data.
 
         """
@@ -200,42 +297,44 @@ class Schedule_Builder:
 
         dir = self.realtime_dir
 
-        # collate all realtime ingests to single dataframe
+        # collate all realtime ingests to single (lazy) dataframe
         tables = os.path.join(dir, f"{region}_{date}*.csv")
-        tables = glob.glob(tables)
-        df_list = (
-            polars_robust_load_csv(table, dtypes={"route_id": pl.Utf8})
-            for table in tables
-        )
-        df = pl.concat(df_list)
+        if next(glob.iglob(tables), None) is None:
+            if self.logger:
+                self.logger.info(f"No realtime data matching {tables}")
+            return pl.DataFrame(schema=REALTIME_SCHEMA).lazy()
 
-        return df
+        lf = polars_robust_scan_csv(tables, dtypes=REALTIME_SCHEMA)
+
+        return lf
 
     def split_realtime_data(
-        self, df: pl.DataFrame
-    ) -> tuple[pl.DataFrame, pl.DataFrame]:
+        self, df: pl.DataFrame | pl.LazyFrame
+    ) -> tuple[pl.DataFrame | pl.LazyFrame, pl.DataFrame | pl.LazyFrame]:
         """Collect and concatenates all realtime data for specified day.
 
         Parameters
         ----------
-        df : polars.DataFrame
+        df : polars.DataFrame or polars.LazyFrame
             Unprocessed realtime data.
 
         Returns
         -------
-        labelled_real : polars.DataFrame
+        labelled_real : polars.DataFrame or polars.LazyFrame
             Rows with trip_id & route_id.
-        unlabelled_real (polars df):
-            Row with trip_id & route_id MISSING (currently unused).
+        unlabelled_real : polars.DataFrame or polars.LazyFrame
+            Rows with trip_id or route_id MISSING (currently unused).
 
         """
-        labelled_real = df.filter(
-            (pl.col("trip_id").is_not_null())
-            & (pl.col("route_id").is_not_null())
-        )
-        unlabelled_real = df.filter(
-            (pl.col("trip_id").is_null()) & (pl.col("route_id").is_null())
+        # compute the labelled mask once and partition on it
+        df = df.with_columns(
+            (
+                pl.col("trip_id").is_not_null()
+                & pl.col("route_id").is_not_null()
+            ).alias("_labelled")
         )
+        labelled_real = df.filter(pl.col("_labelled")).drop("_labelled")
+        unlabelled_real = df.filter(~pl.col("_labelled")).drop("_labelled")
 
         return labelled_real, unlabelled_real
 
@@ -262,8 +361,51 @@ class Schedule_Builder:
         df : polars.DataFrame
             Datframe of region timetable.
 
+        Notes
+        -----
+        Built timetables are cached as parquet in `timetable_cache_dir`,
+        keyed by the build parameters, the GTFS zip modified time, the
+        polars version and the stops, and reused on subsequent runs.
+        The UID is not cached but rebuilt on load.
+
         """
-        df = self.load_raw_timetable_data(stops, region)
+        zip_file = find_GTFS_zip(
+            zip_path=self.timetable_dir,
+            file_name_pattern=f"{region}_{date}.zip",
+            logger=self.logger,
+        )
+        key = "|".join(
+            str(param)
+            for param in (
+                region,
+                date,
+                self.route_types,
+                self.partial_timetable,
+                self.time_from,
+                self.time_to,
+                os.path.getmtime(zip_file),
+                pl.__version__,
+                stops.height,
+            )
+        )
+        key = hashlib.blake2b(key.encode())
+        # stop coordinates are joined into the cached frame
+        key.update(stops.hash_rows(seed=0).to_numpy().tobytes())
+        key = key.hexdigest()[:16]
+        cache = os.path.join(
+            self.timetable_cache_dir, f"{region}_{date}_{key}.parquet"
+        )
+        # UID hashes are not stable across polars versions, so they are
+        # rebuilt on load rather than cached
+        uid = build_uid(
+            "timetable_date", "stop_sequence", "trip_id", "route_id"
+        )
+        if os.path.exists(cache):
+            if self.logger:
+                self.logger.info(f"Loading cached timetable {cache}")
+            return pl.read_parquet(cache).with_columns(uid)
+
+        lf = self.load_raw_timetable_data(stops, region, date)
 
         # slicing timetable with 30 minute buffers either side of
         # realtime window
@@ -271,28 +413,32 @@ class Schedule_Builder:
         tt_time_from = int(datestamp + (self.time_from * 60 * 60) - 1800)
         tt_time_to = int(datestamp + (self.time_to * 60 * 60) + 1800)
         if self.partial_timetable:
-            df = df.filter(
-                (pl.col("unix_arrival_time") >= tt_time_from)
-                & (pl.col("unix_arrival_time") < tt_time_to)
+            lf = lf.filter(
+                (
+                    pl.col("unix_arrival_time")
+                    >= pl.lit(tt_time_from, dtype=pl.Int64)
+                )
+                & (
+                    pl.col("unix_arrival_time")
+                    < pl.lit(tt_time_to, dtype=pl.Int64)
+                )
             )
-        df = df.with_columns(
-            pl.concat_str(
-                [
-                    pl.col("timetable_date"),
-                    pl.col("stop_sequence"),
-                    pl.col("trip_id"),
-                    pl.col("route_id"),
-                ],
-                separator="_",
-            ).alias("UID")
+        lf = lf.unique(
+            subset=["timetable_date", "stop_sequence", "trip_id", "route_id"]
         )
-        df = df.unique("UID")
 
-        return df
+        # single fused, streaming execution of the whole plan
+        with pl.StringCache():
+            df = lf.collect(streaming=True)
+
+        os.makedirs(self.timetable_cache_dir, exist_ok=True)
+        df.write_parquet(cache, compression="zstd")
+
+        return df.with_columns(uid)
 
     def build_realtime(
         self, region: str, date: str
-    ) -> tuple[pl.DataFrame, pl.DataFrame]:
+    ) -> tuple[pl.LazyFrame, pl.LazyFrame]:
         """Process realtime for given region and day.
 
         Apply unique identifier to each service stop and
@@ -307,9 +453,9 @@ class Schedule_Builder:
 
         Returns
         -------
-        df : polars.DataFrame
+        df : polars.LazyFrame
             Dataframe of lbelled real time data for region concatenated.
-        unlabelled : polars.DataFrame
+        unlabelled : polars.LazyFrame
             Dataframe of unlabelled real time data. (Currently not used)
 
         """
@@ -321,60 +467,64 @@ class Schedule_Builder:
 
         df = self.load_raw_realtime_data(region, date)
         df, unlabelled = self.split_realtime_data(df)
-        df = df.sort(
-            ["trip_id", "current_stop", "time_transpond", "time_ingest"]
+        # only the order within each service stop matters, which the
+        # latest ping decides, so sort on the two integer timestamps
+        df = df.sort(["time_transpond", "time_ingest"])
+        df = df.unique(
+            subset=["journey_date", "current_stop", "trip_id", "route_id"],
+            keep="last",
         )
         df = df.with_columns(
-            pl.concat_str(
-                [
-                    pl.col("journey_date"),
-                    pl.col("current_stop"),
-                    pl.col("trip_id"),
-                    pl.col("route_id"),
-                ],
-                separator="_",
-            ).alias("UID")
+            build_uid("journey_date", "current_stop", "trip_id", "route_id")
         )
-        df = df.unique("UID", keep="last")
 
         return df, unlabelled
 
     def punctuality_by_stop(
-        self, realtime_df: pl.DataFrame, timetable_df: pl.DataFrame
-    ) -> pl.DataFrame:
+        self,
+        realtime_df: pl.DataFrame | pl.LazyFrame,
+        timetable_df: pl.DataFrame | pl.LazyFrame,
+    ) -> pl.LazyFrame:
         """Apply punctuality flag to RT/TT combined schedule.
 
         Parameters
         ----------
-        realtime_df : polars.DataFrame
+        realtime_df : polars.DataFrame or polars.LazyFrame
             Dataframe containing real time bus data.
-        timetable_df : polars.DataFrame
+        timetable_df : polars.DataFrame or polars.LazyFrame
             Dataframe containing timetable bus data.
 
         Returns
         -------
-        df : polars.DataFrame
+        df : polars.LazyFrame
             Dataframe containing punctual flag of each bus stop ping.
 
         """
+        # both sides are already unique by UID, so join only the
+        # columns required downstream
         df = (
-            realtime_df[["UID", "time_transpond", "bus_id"]]
-            .join(timetable_df, on="UID", how="inner")
-            .unique()
-        )
-
-        df = df.with_columns(
-            (pl.col("unix_arrival_time") - pl.col("time_transpond")).alias(
-                "relative_punctuality"
+            realtime_df.lazy()
+            .select(["UID", "time_transpond", "bus_id"])
+            .join(
+                timetable_df.lazy().select(
+                    [
+                        "UID",
+                        "unix_arrival_time",
+                        "stop_id",
+                        "stop_lat",
+                        "stop_lon",
+                    ]
+                ),
+                on="UID",
+                how="inner",
             )
         )
+
+        # punctual if between 5 minutes late and 1 minute early
         df = df.with_columns(
-            pl.when(
-                (pl.col("relative_punctuality") > -300)
-                & (pl.col("relative_punctuality") < 60)
-            )
-            .then(1)
-            .otherwise(0)
+            (pl.col("unix_arrival_time") - pl.col("time_transpond"))
+            .is_between(-300, 60, closed="none")
+            .cast(pl.Int8)
             .alias("punctual")
         )
         df = df.group_by(["stop_id", "stop_lat", "stop_lon"]).agg(
@@ -432,25 +582,21 @@ if __name__ == "__main__":
 
     final_df_script = builder.punctuality_by_stop(
         realtime_df=rt, timetable_df=tt
-    )
+    ).collect(streaming=True)
 
     if builder.output_unlabelled_bulk:
         logger.info("Exporting unlablled data to file.")
-        unlabelled = unlabelled.to_pandas()
-        unlabelled.to_csv(
-            f"outputs/unlabelled_{builder.region}_{date}.csv",
-            index=False,
-        )
+        # stream straight from the realtime scan to file
+        unlabelled.sink_csv(f"outputs/unlabelled_{builder.region}_{date}.csv")
 
     logger.info("Writing punctuality to file")
-    pandas_df = (
-        final_df_script.to_pandas()
-        .sort_values("stop_id")
-        .reset_index(drop=True)
+    # categorical stop_id sorts by encoding order, so restore strings
+    final_df_script = final_df_script.with_columns(
+        pl.col("stop_id").cast(pl.Utf8)
     )
-    pandas_df.to_csv(
-        f"data/stop_level_punctuality/punctuality_by_stop_{builder.region}_{date}.csv",  # noqa: E501
-        index=False,
+    final_df_script.sort("stop_id").write_parquet(
+        f"data/stop_level_punctuality/punctuality_by_stop_{builder.region}_{date}.parquet",  # noqa: E501
+        compression="zstd",
     )
 
     logger.info("\n")
@@ -2,14 +2,36 @@
 
 import zipfile
 import os
-import glob
+import shutil
+from functools import lru_cache
 import pandas as pd
 import polars as pl
-from convertbng.util import convert_lonlat
+from pyproj import Transformer
 import logging
+from datetime import datetime
+from zoneinfo import ZoneInfo
 
+# British National Grid (eastings, northings) to WGS84 (lon, lat)
+BNG_TO_WGS84 = Transformer.from_crs("EPSG:27700", "EPSG:4326", always_xy=True)
 
-def deduplicate(df: pd.DataFrame) -> pd.DataFrame:
+LONDON = ZoneInfo("Europe/London")
+
+# NAPTAN columns needed to locate stops
+NAPTAN_DTYPES = {
+    "ATCOCode": pl.Utf8,
+    "Easting": pl.Float64,
+    "Northing": pl.Float64,
+    "Latitude": pl.Float64,
+    "Longitude": pl.Float64,
+}
+
+# chunk size for streaming large GTFS members in and out of zips
+COPY_BUFFER = 1 << 20
+
+
+def deduplicate(
+    df: pl.DataFrame | pl.LazyFrame,
+) -> pl.DataFrame | pl.LazyFrame:
     """Deduplicate dataframe.
 
     Deduplicates realtime BODS data in respect of
@@ -19,17 +41,17 @@ def deduplicate(df: pd.DataFrame) -> pd.DataFrame:
 
     Parameters
     ----------
-    df : pandas.DataFrame
+    df : polars.DataFrame or polars.LazyFrame
         Dataframe to remove duplicates from.
 
     Returns
     -------
-    df : pandas.DataFrame
+    df : polars.DataFrame or polars.LazyFrame
         Processed dataframe without duplicates.
 
     """
-    df = df.drop_duplicates(
-        [
+    df = df.unique(
+        subset=[
             "bus_id",
             "time_transpond",
             "latitude",
@@ -72,10 +94,13 @@ def zip_files(to_dir: str, zip_name: str):
     # Create a new .zip file
     with zipfile.ZipFile(f"{zip_file}", "w", zipfile.ZIP_DEFLATED) as archive:
         for txt_file in txt_files:
-            # Add each .txt file to the zip
-            archive.write(
-                f"{to_dir}/{txt_file}", arcname=txt_file
-            )  # noqa: E501
+            # Stream each .txt file into the zip in large chunks
+            src_path = f"{to_dir}/{txt_file}"
+            info = zipfile.ZipInfo.from_file(src_path, arcname=txt_file)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with open(src_path, "rb", buffering=COPY_BUFFER) as src:
+                with archive.open(info, "w", force_zip64=True) as dst:
+                    shutil.copyfileobj(src, dst, COPY_BUFFER)
 
     return None
 
@@ -114,11 +139,10 @@ def unzip_GTFS(
         "trips.txt",
     ]
 
-    missing_files = [
-        file
-        for file in txt_files
-        if not os.path.exists(os.path.join(txt_path, file))  # noqa: E501
-    ]
+    existing = set()
+    if os.path.isdir(txt_path):
+        existing = {entry.name for entry in os.scandir(txt_path)}
+    missing_files = [file for file in txt_files if file not in existing]
 
     if missing_files:
         if logger:
@@ -126,30 +150,74 @@ def unzip_GTFS(
                 f"Missing files: {missing_files}. Searching zip GTFS."  # noqa:E501
             )
 
-        matching_zip = glob.glob(
-            os.path.join(zip_path, f"*{file_name_pattern}")
-        )  # noqa:E501
-
-        # Checks there is a matching zip file
-        if not matching_zip:
-            if logger:
-                logger.info("No GTFS zip in directory.")
-            raise ValueError(f"No {file_name_pattern} in {zip_path}")
-
-        # check there is not more than 1 zip file
-        if len(matching_zip) > 1:
-            if logger:
-                logger.info(f"More than 1 {file_name_pattern} in {zip_path}")
-            raise ValueError("More than 1 file_name_pattern in zip_path")
+        zip_full_path = find_GTFS_zip(zip_path, file_name_pattern, logger)
 
         # Unzips contents of zip to txt path
-        zip_full_path = matching_zip[0]
+        os.makedirs(txt_path, exist_ok=True)
         with zipfile.ZipFile(zip_full_path, "r") as zip_ref:
-            # Extract to path
-            zip_ref.extractall(txt_path)
+            # Stream each member to path in large chunks
+            for info in zip_ref.infolist():
+                if info.is_dir():
+                    continue
+                out_path = os.path.join(
+                    txt_path, os.path.basename(info.filename)
+                )
+                with zip_ref.open(info) as src, open(out_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst, COPY_BUFFER)
+
+
+def find_GTFS_zip(
+    zip_path: str,
+    file_name_pattern: str = "timetable.zip",
+    logger: logging.Logger = None,
+) -> str:
+    """Find the single GTFS zip matching a file name pattern.
+
+    Parameters
+    ----------
+    zip_path: str
+        Path to dir where .zip file is located.
+    file_name_pattern : str, optional
+        Suffix of file to find defaults 'timetable.zip'.
+    logger : logger.Logger, optional
+        Logger object used to collect info of process.
 
+    Returns
+    -------
+    zip_full_path : str
+        Path to the matching zip file.
+
+    Raises
+    ------
+    ValueError
+        When no zip, or more than one zip, matches the pattern.
+
+    """
+    matching_zip = []
+    if os.path.isdir(zip_path):
+        matching_zip = [
+            entry.path
+            for entry in os.scandir(zip_path)
+            if entry.name.endswith(file_name_pattern)
+        ]
+
+    # Checks there is a matching zip file
+    if not matching_zip:
+        if logger:
+            logger.info("No GTFS zip in directory.")
+        raise ValueError(f"No {file_name_pattern} in {zip_path}")
 
-def convert_SINGLE_datetime_to_unix(date: str = None) -> pd.Timestamp:
+    # check there is not more than 1 zip file
+    if len(matching_zip) > 1:
+        if logger:
+            logger.info(f"More than 1 {file_name_pattern} in {zip_path}")
+        raise ValueError("More than 1 file_name_pattern in zip_path")
+
+    return matching_zip[0]
+
+
+@lru_cache(maxsize=128)
+def convert_SINGLE_datetime_to_unix(date: str = None) -> int:
     """Convert a single date to UNIX format.
 
     Parameters
@@ -159,62 +227,58 @@ def convert_SINGLE_datetime_to_unix(date: str = None) -> pd.Timestamp:
 
     Returns
     -------
-    timestamp : pd.Timestamp
-        Timestamp at mightnight 00:00:00 of the provided date.
+    timestamp : int
+        UNIX timestamp at midnight 00:00:00 London time of the provided date.
 
     """
-    timestamp = (
-        pd.to_datetime(
-            str(date) + " " + "00:00:00", format="%Y%m%d %H:%M:%S"
-        )  # noqa:E501
-        .tz_localize("Europe/London")
-        .tz_convert("UTC")
-    )
-    timestamp = (
-        timestamp - pd.Timestamp("1970-01-01", tz="UTC")
-    ) // pd.Timedelta(  # noqa:E501
-        "1s"
-    )  # noqa: E501
+    midnight = datetime.strptime(str(date), "%Y%m%d").replace(tzinfo=LONDON)
+    timestamp = int(midnight.timestamp())
 
     return timestamp
 
 
 def convert_string_time_to_unix(
-    df: pl.DataFrame = None, time_column: str = None
-) -> pl.DataFrame:
+    df: pl.DataFrame | pl.LazyFrame = None,
+    time_column: str = None,
+    date: str = None,
+) -> pl.DataFrame | pl.LazyFrame:
     """Add additional column: unix timestamps to date string.
 
     Parameters
     ----------
-    df : polars.DataFrame
+    df : polars.DataFrame or polars.LazyFrame
         Dataframe containing timetable data.
     time_column : str
         Name of columns containing string fomat time.
+    date : str, optional
+        Date in string format %Y%m%d shared by every row, otherwise
+        taken per row from the "timetable_date" column.
 
     Returns
     -------
-    df : polars.DataFrame
+    df : polars.DataFrame or polars.LazyFrame
         Dataframe containing new column with UNIX format time.
 
     """
-    # TODO: refactor into one
-    df = df.with_columns(
-        pl.format("{} {}", "timetable_date", time_column).alias(
-            f"unix_{time_column}"
-        )
+    # time of day as seconds after local midnight, so GTFS times
+    # beyond 24:00:00 roll into the following day
+    hms = pl.col(time_column).str.split(":")
+    seconds = (
+        hms.list.get(0).cast(pl.Int64) * 3600
+        + hms.list.get(1).cast(pl.Int64) * 60
+        + hms.list.get(2).cast(pl.Int64)
     )
-    df = df.with_columns(
-        pl.col(f"unix_{time_column}").str.to_datetime("%Y%m%d %H:%M:%S")
-    )
-    df = df.with_columns(
-        pl.col(f"unix_{time_column}")
-        #        .cast(pl.Datetime)
-        .dt.replace_time_zone("Europe/London")
-    )
-    df = df.with_columns(
-        pl.col(f"unix_{time_column}").dt.convert_time_zone("UTC")
-    )
-    df = df.with_columns(pl.col(f"unix_{time_column}").dt.epoch(time_unit="s"))
+    if date is None:
+        midnight = (
+            pl.col("timetable_date")
+            .cast(pl.Utf8)
+            .str.to_datetime("%Y%m%d")
+            .dt.replace_time_zone("Europe/London")
+            .dt.epoch(time_unit="s")
+        )
+    else:
+        midnight = pl.lit(convert_SINGLE_datetime_to_unix(date), pl.Int64)
+    df = df.with_columns((midnight + seconds).alias(f"unix_{time_column}"))
 
     return df
 
@@ -241,34 +305,79 @@ def convert_unix_to_time_string(
 
     """
     df = df.with_columns(
-        pl.from_epoch(pl.col(unix_column), time_unit="s").alias(
-            f"dt_{unix_column}"
-        )
-    )
-    df = df.with_columns(
-        pl.col(f"dt_{unix_column}")
+        pl.from_epoch(pl.col(unix_column), time_unit="s")
         .cast(pl.Datetime)
         .dt.replace_time_zone("UTC")
+        .dt.convert_time_zone("Europe/London")
+        .cast(pl.Time)
+        .alias(f"dt_{unix_column}")
     )
-    df = df.with_columns(
-        pl.col(f"dt_{unix_column}").dt.convert_time_zone("Europe/London")
-    )
-    df = df.with_columns(pl.col(f"dt_{unix_column}").cast(pl.Time))
 
     return df
 
 
+def build_uid(
+    date: str, stop_sequence: str, trip_id: str, route_id: str
+) -> pl.Expr:
+    """Build hashed unique identifier of a service stop.
+
+    Hashes the service stop key columns into a single u64 rather
+    than concatenating a long string. Columns are cast to common
+    dtypes so timetable and realtime identifiers are comparable.
+
+    Parameters
+    ----------
+    date : str
+        Name of column containing date of service.
+    stop_sequence : str
+        Name of column containing stop sequence of service.
+    trip_id : str
+        Name of column containing trip_id.
+    route_id : str
+        Name of column containing route_id.
+
+    Returns
+    -------
+    uid : polars.Expr
+        Expression evaluating to the "UID" column.
+
+    """
+    uid = (
+        pl.struct(
+            [
+                pl.col(date).cast(pl.Utf8).alias("date"),
+                pl.col(stop_sequence).cast(pl.Int64).alias("stop_sequence"),
+                pl.col(trip_id).cast(pl.Utf8).alias("trip_id"),
+                pl.col(route_id).cast(pl.Utf8).alias("route_id"),
+            ]
+        )
+        .hash(seed=0)
+        .alias("UID")
+    )
+    return uid
+
+
 def build_stops(
-    output: str = "polars", stops_data: str = "data/resources/gb_stops.csv"
+    output: str = "polars",
+    stops_data: str = "data/resources/gb_stops.csv",
+    cache_path: str = None,
+    invalidate_cache: bool = False,
 ) -> pl.DataFrame | pd.DataFrame:
     """Read in gb_stops file and outouts as DataFrame.
 
+    The converted stops are cached as parquet and reused until the
+    raw NAPTAN file is modified.
+
     Parameters
     ----------
     output : str
         Output type, polars or pandas DataFrame. (Defaults "polars").
     stops_data : str
         Filepath to raw NAPTAN stops data locally.
+    cache_path : str, optional
+        Filepath to parquet cache, defaults to stops_data as .parquet.
+    invalidate_cache : bool, optional
+        Rebuild stops from the raw data even if cached.
 
     Returns
     -------
@@ -276,16 +385,33 @@ def build_stops(
         Dataframe containing stop data.
 
     """
-    # import NapTAN data
-    stops = pl.read_csv(
-        stops_data,
-        ignore_errors=True,
-        dtypes={"stop_id": pl.Utf8},  # noqa: E501
+    if cache_path is None:
+        cache_path = f"{os.path.splitext(stops_data)[0]}.parquet"
+
+    if (
+        not invalidate_cache
+        and os.path.exists(cache_path)
+        and os.path.getmtime(cache_path) >= os.path.getmtime(stops_data)
+    ):
+        stops = pl.read_parquet(cache_path)
+        if output == "pandas":
+            stops = stops.to_pandas()
+        return stops
+
+    # import NapTAN data, parsing only the columns used
+    stops = (
+        pl.scan_csv(
+            stops_data,
+            ignore_errors=True,
+            dtypes=NAPTAN_DTYPES,
+        )
+        .select(["ATCOCode", "Easting", "Northing", "Latitude", "Longitude"])
+        .collect()
     )
 
-    eastings = stops["Easting"].to_list()
-    northings = stops["Northing"].to_list()
-    lon, lat = convert_lonlat(eastings, northings)
+    eastings = stops["Easting"].to_numpy()
+    northings = stops["Northing"].to_numpy()
+    lon, lat = BNG_TO_WGS84.transform(eastings, northings)
 
     stops = stops.with_columns(pl.Series(name="LatitudeNew", values=lat))
     stops = stops.with_columns(pl.Series(name="LongitudeNew", values=lon))
@@ -298,6 +424,7 @@ def build_stops(
 
     stops = stops[["ATCOCode", "Latitude", "Longitude"]]
     stops.columns = ["stop_id", "stop_lat", "stop_lon"]
+    stops.write_parquet(cache_path, compression="zstd")
 
     if output == "pandas":
         stops = stops.to_pandas()
@@ -305,13 +432,15 @@ def build_stops(
     return stops
 
 
-def polars_robust_load_csv(filepath: str, dtypes: dict = None) -> pl.DataFrame:
+def polars_robust_load_csv(
+    filepath: str | bytes, dtypes: dict = None
+) -> pl.DataFrame:
     """Load csv using polars with resilient settings.
 
     Prameters
     ---------
-    filepath : str
-        Filepath to csv to load.
+    filepath : str or bytes
+        Filepath to csv to load, or raw csv contents.
     dtypes : dict, optional
         Dictionary of columns and dtypes to load as.
 
@@ -333,3 +462,71 @@ def polars_robust_load_csv(filepath: str, dtypes: dict = None) -> pl.DataFrame:
             filepath, ignore_errors=True, infer_schema_length=None
         )
     return df
+
+
+def polars_robust_scan_csv(
+    filepath: str, dtypes: dict = None
+) -> pl.LazyFrame:
+    """Lazily scan csv using polars with resilient settings.
+
+    Lazy counterpart to `polars_robust_load_csv`, allowing filters
+    and joins to be pushed down before any data is materialised.
+
+    Parameters
+    ----------
+    filepath : str
+        Filepath (or glob pattern) of csv to scan.
+    dtypes : dict, optional
+        Dictionary of columns and dtypes to load as.
+
+    Returns
+    -------
+    lf : polars.LazyFrame
+        LazyFrame of csv from filepath.
+
+    """
+    lf = pl.scan_csv(
+        filepath,
+        ignore_errors=True,
+        infer_schema_length=None,
+        dtypes=dtypes,
+    )
+    return lf
+
+
+def polars_load_csv_with_schema(
+    source: str | bytes, schema: dict, columns: list = None
+) -> pl.DataFrame:
+    """Load csv using polars against a pre-declared schema.
+
+    Skips dtype inference entirely: columns named in `schema` are
+    parsed directly as their declared dtype, any others as strings,
+    and malformed values raise rather than being nulled. Columns
+    absent from the file are ignored, so optional columns may be
+    declared freely.
+
+    Parameters
+    ----------
+    source : str or bytes
+        Filepath to csv to load, or raw csv contents.
+    schema : dict
+        Dictionary of columns and dtypes to load as.
+    columns : list, optional
+        Only parse these columns, where present in the file.
+
+    Returns
+    -------
+    df : polars.DataFrame
+        Dataframe of csv from source.
+
+    """
+    header = pl.read_csv(source, infer_schema_length=0, n_rows=1).columns
+    if columns is not None:
+        header = [col for col in columns if col in header]
+    df = pl.read_csv(
+        source,
+        infer_schema_length=0,
+        columns=header,
+        dtypes={col: schema[col] for col in header if col in schema},
+    )
+    return df
@@ -1,7 +1,54 @@
 """Class of tools required to reaggregate bus metrics by geographies."""
-import pandas as pd
-import toml
+import os
+import polars as pl
+from functools import lru_cache
 from datetime import datetime
+from src.bus_metrics.setup.ingest_config import load_ingest_toml
+
+# column types of the stop-level punctuality data
+STOP_DTYPES = {
+    "stop_id": pl.Utf8,
+    "stop_lat": pl.Float64,
+    "stop_lon": pl.Float64,
+    "service_stops": pl.UInt32,
+    "punctuality_rate": pl.Float32,
+}
+
+
+@lru_cache(maxsize=4)
+def _load_lookup(path: str, mtime: float, dtypes: tuple) -> pl.DataFrame:
+    """Read geography lookup table, cached until the file changes.
+
+    Parameters
+    ----------
+    path: str
+        Full filepath to geography lookup parquet or csv.
+    mtime: float
+        Modification time of the file, part of the cache key.
+    dtypes: tuple
+        Pairs of columns and dtypes to load as.
+
+    Returns
+    -------
+    df: polars.DataFrame
+        Stops-geography lookup table.
+
+    """
+    if path.endswith(".parquet"):
+        df = pl.read_parquet(path)
+        return df.with_columns(
+            [
+                pl.col(col).cast(dtype)
+                for col, dtype in dtypes
+                if col in df.columns
+            ]
+        )
+
+    df = pl.read_csv(path, dtypes=dict(dtypes))
+    if "" in df.columns:
+        df = df.drop("")
+
+    return df
 
 
 class AggregationTool:
@@ -11,8 +58,9 @@ class AggregationTool:
     ----------
     stop_level_punctuality: str
         Full filepath to stop-level punctuality aggregated data
-    config: dict
-        Dictionary of imported toml ingest variables
+    config: dict, optional
+        Dictionary of imported toml ingest variables, defaults to
+        the cached ingest toml
     geography: str
         Geography by which data is to be aggregated
 
@@ -33,30 +81,108 @@ class AggregationTool:
 
     def __init__(
         self,
-        config: dict = toml.load("src/bus_metrics/setup/ingest.toml"),
-        geography_lookup_table: str = "data/resources/geography_lookup_table.csv",  # noqa: E501
+        config: dict | None = None,
+        geography_lookup_table: str = "data/resources/geography_lookup_table.parquet",  # noqa: E501
         geography: str = "lsoa",
         outdir: str = "outputs/punctuality",
     ) -> None:
 
+        if config is None:
+            config = load_ingest_toml()
         self.region = config["region_to_analyse"]
         self.date = datetime.now().strftime("%Y%m%d")
-        self.stop_level_punctuality: str = f"data/stop_level_punctuality/punctuality_by_stop_{self.region}_{self.date}.csv"  # noqa: E501
+        self.stop_level_punctuality: str = f"data/stop_level_punctuality/punctuality_by_stop_{self.region}_{self.date}.parquet"  # noqa: E501
         self.geography_lookup_table = geography_lookup_table
         self.geography = geography
         self.config = config
         self.code = self.config["boundaries"][self.geography]["code"]
         self.name = self.config["boundaries"][self.geography]["name"]
         self.outdir = outdir
+        # geography codes and names are always strings
+        self.lookup_dtypes = {
+            "stop_id": pl.Utf8,
+            "stop_lat": pl.Float64,
+            "stop_lon": pl.Float64,
+        }
+        for bounds in self.config["boundaries"].values():
+            self.lookup_dtypes[bounds["code"]] = pl.Utf8
+            self.lookup_dtypes[bounds["name"]] = pl.Utf8
+
+    def _scan_stops(self, filepath: str, dtypes: dict) -> pl.LazyFrame:
+        """Lazily scan stop-level parquet or csv with set dtypes.
+
+        Any unnamed pandas index column in a csv is dropped.
+
+        Parameters
+        ----------
+        filepath: str
+            Full filepath to parquet or csv.
+        dtypes: dict
+            Dictionary of columns and dtypes to load as.
+
+        Returns
+        -------
+        lf: polars.LazyFrame
+            LazyFrame of stop-level data.
+
+        Raises
+        ------
+        FileNotFoundError
+            When the file does not exist locally.
+
+        """
+        if not os.path.exists(filepath):
+            raise FileNotFoundError(f"No such file: '{filepath}'.")
+
+        if filepath.endswith(".parquet"):
+            lf = pl.scan_parquet(filepath)
+            lf = lf.with_columns(
+                [
+                    pl.col(col).cast(dtype)
+                    for col, dtype in dtypes.items()
+                    if col in lf.columns
+                ]
+            )
+            return lf
+
+        lf = pl.scan_csv(filepath, dtypes=dtypes)
+        if "" in lf.columns:
+            lf = lf.drop("")
+
+        return lf
+
+    def _load_geography_lookup(self) -> pl.LazyFrame:
+        """Load geography lookup, reusing it while the file is unchanged.
+
+        Returns
+        -------
+        lf: polars.LazyFrame
+            Stops-geography lookup table.
+
+        Raises
+        ------
+        FileNotFoundError
+            When the lookup does not exist locally.
+
+        """
+        path = self.geography_lookup_table
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No such file: '{path}'.")
+
+        df = _load_lookup(
+            path, os.path.getmtime(path), tuple(self.lookup_dtypes.items())
+        )
+
+        return df.lazy()
 
     def merge_geographies_with_stop_punctuality(
         self,
-    ) -> pd.DataFrame | Exception:
+    ) -> pl.LazyFrame | Exception:
         """Merge geography labels and stop-level punctuality.
 
         Returns
         -------
-        df: pandas.DataFrame
+        lf: polars.LazyFrame
             Dataframe of stop-level punctuality with all
             associated geography labels.
 
@@ -68,66 +194,85 @@ class AggregationTool:
 
         """
         try:
-            stops = pd.read_csv(self.stop_level_punctuality, index_col=0)
-            lookup = pd.read_csv(self.geography_lookup_table, index_col=0)
-            df = pd.merge(
-                stops,
+            stops = self._scan_stops(
+                self.stop_level_punctuality, STOP_DTYPES
+            )
+            lookup = self._load_geography_lookup()
+            lf = stops.join(
                 lookup,
                 on=["stop_id", "stop_lat", "stop_lon"],
                 how="left",
             )
-            return df
+            return lf
 
         except FileNotFoundError as e:
             print(e, "Please re-run the build_lookup.py script.")
             raise
 
     def _reaggregate_punctuality(
-        self, labelled: pd.DataFrame = None
-    ) -> pd.DataFrame:
+        self, labelled: pl.DataFrame | pl.LazyFrame = None
+    ) -> pl.LazyFrame:
         """Re-aggregate stop-level punctuality by specified geography.
 
         Parameters
         ----------
-        labelled: pandas.DataFrame
+        labelled: polars.DataFrame or polars.LazyFrame
             Dataframe of stop-level punctuality with all
             available geography labels associated with each.
 
         Returns
         -------
-        df: pandas.DataFrame
+        lf: polars.LazyFrame
             Dataframe of number of service stops
             and punctuality rate aggregated by geography.
 
         """
-        code = self.config["boundaries"][self.geography]["code"]
-        name = self.config["boundaries"][self.geography]["name"]
-
-        labelled["punctual_service_stops"] = (
-            labelled["service_stops"] * labelled["punctuality_rate"]
-        ).astype(int)
-        df = labelled.groupby([code, name]).agg(
-            {"service_stops": "sum", "punctual_service_stops": "sum"}
-        )
-        df["punctuality_rate"] = (
-            df["punctual_service_stops"] / df["service_stops"]
+        lf = (
+            labelled.lazy()
+            .with_columns(
+                (
+                    pl.col("service_stops").cast(pl.Float32)
+                    * pl.col("punctuality_rate").cast(pl.Float32)
+                )
+                # rate is punctual / service stops, so round back to a
+                # whole count rather than truncating float error
+                .round(0)
+                .cast(pl.UInt32)
+                .alias("punctual_service_stops")
+            )
+            # stops outside every boundary carry no label, so leave
+            # them out rather than grouping them under a null geography
+            .drop_nulls([self.code, self.name])
+            .group_by([self.code, self.name])
+            .agg(
+                [
+                    pl.sum("service_stops"),
+                    pl.sum("punctual_service_stops"),
+                ]
+            )
+            .with_columns(
+                (
+                    pl.col("punctual_service_stops") / pl.col("service_stops")
+                ).alias("punctuality_rate")
+            )
+            .sort([self.code, self.name])
         )
-        df = df.reset_index()
 
-        return df
+        return lf
 
-    def punctuality_by_geography(self):
+    def punctuality_by_geography(self) -> pl.DataFrame:
         """Collect punctuality data, reaggregate and store locally.
 
         Returns
         -------
-        df: pandas.DataFrame
+        df: polars.DataFrame
             Dataframe of number of service stops
             and punctuality rate aggregated by geography.
 
         """
         date_time = datetime.now().strftime("%Y%m%d-%H%M%S")
-        df = self.merge_geographies_with_stop_punctuality()
-        df = self._reaggregate_punctuality(df)
-        df.to_csv(f"{self.outdir}/{self.geography}_{date_time}.csv")
+        lf = self.merge_geographies_with_stop_punctuality()
+        lf = self._reaggregate_punctuality(lf)
+        df = lf.collect(streaming=True)
+        df.write_csv(f"{self.outdir}/{self.geography}_{date_time}.csv")
         return df
@@ -1,16 +1,56 @@
 """Tool to generate lookup table for stops to various geography levels."""
 
-import toml
+import os
 import geopandas as gpd
 import pandas as pd
+import polars as pl
+from src.bus_metrics.aggregation.preprocessing import NAPTAN_DTYPES
+from src.bus_metrics.setup.ingest_config import load_ingest_toml
 from src.bus_metrics.setup.ingest_static_data import StaticDataIngest
 
 
+def _read_boundaries(
+    filename: str, bounds_code: str, bounds_name: str
+) -> gpd.GeoDataFrame:
+    """Read label columns of boundaries, via a GeoParquet copy.
+
+    The downloaded GeoJSON is parsed once and stored alongside as
+    GeoParquet, which is reused until the GeoJSON is modified.
+
+    Parameters
+    ----------
+    filename: str
+        Filepath to boundaries GeoJSON.
+    bounds_code: str
+        Geography code e.g. LSOA21CD
+    bounds_name: str
+        Geography name e.g. LSOA21NM
+
+    Returns
+    -------
+    bounds: geopandas.GeoDataFrame
+        Geography code, name and geometry.
+
+    """
+    columns = [bounds_code, bounds_name]
+    cache = f"{os.path.splitext(filename)[0]}.parquet"
+    if os.path.exists(cache) and (
+        os.path.getmtime(cache) >= os.path.getmtime(filename)
+    ):
+        return gpd.read_parquet(cache, columns=columns + ["geometry"])
+
+    # GDAL's reader via pyogrio, parsing only the label columns
+    bounds = gpd.read_file(filename, engine="pyogrio", columns=columns)
+    bounds.to_parquet(cache)
+
+    return bounds
+
+
 def _build_lookup_tool(
     stops: pd.DataFrame,
+    points: gpd.GeoSeries,
     bounds: gpd.GeoDataFrame,
-    bounds_code: str,
-    bounds_name: str,
+    boundaries: dict,
 ) -> pd.DataFrame:
     """Allocate geography labels to bus stops by means of a spatial join.
 
@@ -18,12 +58,14 @@ def _build_lookup_tool(
     ----------
     stops: pandas.DataFrame
         Dataframe of NAPTAN stops data.
+    points: geopandas.GeoSeries
+        Stop locations, positionally aligned with stops.
     bounds: geopandas.GeoDataFrame
-        Dataframe of geography boundaries data.
-    bounds_code: str
-        Geography code e.g. LSOA21CD
-    bounds_name: str
-        Geography name e.g. LSOA21NM
+        All geography boundary layers stacked, with _layer, _code
+        and _name columns, in the same crs as points.
+    boundaries: dict
+        Boundaries config, keyed by layer with code and name e.g.
+        LSOA21CD and LSOA21NM.
 
     Returns
     -------
@@ -31,23 +73,43 @@ def _build_lookup_tool(
         Dataframe of stops-geography lookup table.
 
     """
-    stops["geometry"] = gpd.points_from_xy(
-        stops["stop_lon"], stops["stop_lat"]
+    # query every layer's spatial index with every stop in one pass
+    idx_stops, idx_bounds = bounds.sindex.query(points, predicate="within")
+    matches = pd.DataFrame(
+        {
+            "_stop": idx_stops,
+            "_layer": bounds["_layer"].to_numpy()[idx_bounds],
+            "_code": bounds["_code"].to_numpy()[idx_bounds],
+            "_name": bounds["_name"].to_numpy()[idx_bounds],
+        }
     )
-    stops = gpd.GeoDataFrame(stops)
-    stops = stops.set_crs("4326")
-    df = stops.sjoin(bounds, how="left", predicate="within")
-
-    cols = list(stops.columns)
-    cols.extend((bounds_code, bounds_name))
-    df = df[cols]
+    # keep the first boundary should any layer's polygons overlap
+    matches = matches.drop_duplicates(subset=["_stop", "_layer"])
+
+    df = stops
+    for geog, cfg in boundaries.items():
+        layer = matches[matches["_layer"] == geog]
+        labels = pd.DataFrame(
+            {
+                cfg["code"]: layer["_code"].to_numpy(),
+                cfg["name"]: layer["_name"].to_numpy(),
+            },
+            index=stops.index[layer["_stop"].to_numpy()],
+        )
+        df = df.join(labels)
 
     return df
 
 
-def create() -> pd.DataFrame:
+def create(config: dict | None = None) -> pd.DataFrame:
     """Download and process boundaries data. Label stops.
 
+    Parameters
+    ----------
+    config: dict, optional
+        Dictionary of imported toml ingest variables, defaults to
+        the cached ingest toml
+
     Returns
     -------
     stops: pandas.DataFrame
@@ -55,15 +117,34 @@ def create() -> pd.DataFrame:
 
     """
     installer = StaticDataIngest()
-    config = toml.load("src/bus_metrics/setup/ingest.toml")
+    if config is None:
+        config = load_ingest_toml()
     boundaries = config["boundaries"]
 
-    # TODO: address mixed dtypes pandas DtypeWarning
-    stops = pd.read_csv("data/resources/gb_stops.csv", index_col=0)
-    stops = stops[stops["Status"] == "active"]
-    stops = stops[["ATCOCode", "Latitude", "Longitude"]]
-    stops.columns = ["stop_id", "stop_lat", "stop_lon"]
+    stops = (
+        pl.scan_csv(
+            "data/resources/gb_stops.csv",
+            ignore_errors=True,
+            dtypes={**NAPTAN_DTYPES, "Status": pl.Utf8},
+        )
+        .filter(pl.col("Status") == "active")
+        .select(
+            [
+                pl.col("ATCOCode").alias("stop_id"),
+                pl.col("Latitude").alias("stop_lat"),
+                pl.col("Longitude").alias("stop_lon"),
+            ]
+        )
+        .collect()
+        .to_pandas()
+    )
+    stops = stops.reset_index(drop=True)
+    points = gpd.GeoSeries(
+        gpd.points_from_xy(stops["stop_lon"], stops["stop_lat"]),
+        crs="EPSG:4326",
+    )
 
+    layers = []
     # TODO: consider tqdm progress bar for large file downloads
     for geog in boundaries:
         url = boundaries[geog]["url"]
@@ -80,14 +161,24 @@ def create() -> pd.DataFrame:
         except FileExistsError:
             pass
 
-        bounds = gpd.read_file(filename)
-        stops = _build_lookup_tool(stops, bounds, code, name)
-        stops = stops.drop(columns="geometry")
+        bounds = _read_boundaries(filename, code, name)
+        if bounds.crs != points.crs:
+            bounds = bounds.to_crs(points.crs)
+        bounds = bounds.rename(columns={code: "_code", name: "_name"})
+        bounds["_layer"] = geog
+        layers.append(bounds[["_layer", "_code", "_name", "geometry"]])
+
+    bounds = gpd.GeoDataFrame(
+        pd.concat(layers, ignore_index=True), crs=points.crs
+    )
+    stops = _build_lookup_tool(stops, points, bounds, boundaries)
 
     print("Storing lookup file...")
     # note: currently retains all stops in NAPTAN data
     # irrespective of location across UK
-    stops.to_csv("data/resources/geography_lookup_table.csv")
+    pl.from_pandas(stops).write_parquet(
+        "data/resources/geography_lookup_table.parquet", compression="zstd"
+    )
 
     return stops
 
@@ -0,0 +1,48 @@
+"""Shared loader for the ingest config."""
+import copy
+import os
+import toml
+from functools import lru_cache
+
+INGEST_TOML = "src/bus_metrics/setup/ingest.toml"
+
+
+def load_ingest_toml(path: str = INGEST_TOML) -> dict:
+    """Load ingest config, parsing the toml once per process.
+
+    The parsed config is held in memory keyed by the toml's
+    modification time, so edits are picked up on the next load.
+    Each caller receives its own copy and may modify it freely.
+
+    Parameters
+    ----------
+    path: str
+        Filepath to ingest toml
+
+    Returns
+    -------
+    config: dict
+        Dictionary of imported toml ingest variables
+
+    """
+    return copy.deepcopy(_load_cfg(path, os.path.getmtime(path)))
+
+
+@lru_cache(maxsize=4)
+def _load_cfg(path: str, mtime: float) -> dict:
+    """Parse ingest toml.
+
+    Parameters
+    ----------
+    path: str
+        Filepath to ingest toml
+    mtime: float
+        Modification time of the toml, part of the cache key
+
+    Returns
+    -------
+    config: dict
+        Dictionary of imported toml ingest variables
+
+    """
+    return toml.load(path)
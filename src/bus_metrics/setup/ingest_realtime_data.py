@@ -1,18 +1,63 @@
 """Class for ingesting realtime BODS data."""
 
-import toml
 from dotenv import load_dotenv
 import os
-import time
 from csv import writer
 from datetime import datetime
-import numpy as np
 from bods_client.client import BODSClient
 from bods_client.models import BoundingBox, GTFSRTParams
 from google.transit import gtfs_realtime_pb2
+from src.bus_metrics.setup.ingest_config import load_ingest_toml
 
 load_dotenv()
 
+# buffer a whole feed message's rows before writing to disk
+WRITE_BUFFER = 1 << 20
+
+
+def _bus_updates(packet, time_ingress: int, date: str):
+    """Flatten vehicle positions with a valid trip_id into csv rows.
+
+    Parameters
+    ----------
+    packet: Iterable[gtfs_realtime_pb2.FeedEntity]
+        Entities of a feed message
+    time_ingress: int
+        UNIX timestamp of ingest
+    date: str
+        Journey date in YYYYMMDD format
+
+    Yields
+    ------
+    row: tuple
+        Values in the realtime csv column order
+
+    """
+    for entity in packet:
+        # bind nested messages once; each protobuf attribute
+        # access is a descriptor lookup
+        vehicle = entity.vehicle
+        trip = vehicle.trip
+        trip_id = trip.trip_id
+
+        # only accept buses with valid trip_id
+        if not trip_id:
+            continue
+
+        position = vehicle.position
+        yield (
+            time_ingress,
+            vehicle.timestamp,
+            vehicle.vehicle.id,
+            trip_id,
+            trip.route_id,
+            vehicle.current_stop_sequence,
+            position.latitude,
+            position.longitude,
+            position.bearing,
+            date,
+        )
+
 
 class RealtimeDataIngest:
     """Ingest realtime BODS data.
@@ -40,21 +85,23 @@ class RealtimeDataIngest:
 
     """
 
-    def __init__(self, time_ingest: str = datetime.now().ctime()):
-        self.config: dict = toml.load("src/bus_metrics/setup/ingest.toml")
+    def __init__(self, time_ingest: str | None = None):
+        self.config: dict = load_ingest_toml()
         self.api_key: str = os.getenv("BODS_API_KEY")
         self.region: str = self.config["region_to_analyse"]
+        if time_ingest is None:
+            time_ingest = datetime.now().ctime()
         self.time_ingest: str = time_ingest
         self.store_data_fp: str = f"data/realtime/{self.region}"
         self.message: gtfs_realtime_pb2.FeedMessage = None
 
-    def api_call(self) -> dict:
+    def api_call(self) -> gtfs_realtime_pb2.FeedMessage:
         """Ingest all bus locations within specified bounding box.
 
         Returns
         -------
-        message.entity: dict
-            nested dictionary capturing vehicle, position and timestamp
+        message: gtfs_realtime_pb2.FeedMessage
+            Feed message capturing vehicle, position and timestamp
             attributes for all current bus locations
 
         """
@@ -65,25 +112,36 @@ class RealtimeDataIngest:
         params = GTFSRTParams(bounding_box=bounding_box)
         self.message = bods.get_gtfs_rt_data_feed(params=params)
 
-        return None
+        return self.message
 
-    def parse_realtime(self, filename: str = None) -> None:
+    def parse_realtime(
+        self,
+        filename: str = None,
+        message: gtfs_realtime_pb2.FeedMessage = None,
+    ) -> None:
         """Parse API return and write to csv file.
 
         Parameters
         ----------
         filename: str
             Full filepath to storage location
+        message: gtfs_realtime_pb2.FeedMessage
+            Feed message to parse, defaults to latest API return
 
         """
-        packet = self.message.entity
-        num_buses = len(packet)
+        if message is None:
+            message = self.message
+        packet = message.entity
+        # one ingest time for the whole feed message
+        now = datetime.now()
 
         if filename is None:
-            fileTimeStamp = datetime.now().strftime("%Y%m%d-%H:%M:%S")
+            fileTimeStamp = now.strftime("%Y%m%d-%H:%M:%S")
             filename = f"{self.store_data_fp}_{fileTimeStamp}.csv"
 
-        with open(filename, "a", newline="") as csv_file:
+        with open(
+            filename, "a", newline="", buffering=WRITE_BUFFER
+        ) as csv_file:
             csv_obj = writer(csv_file)
             csv_obj.writerow(
                 [
@@ -99,45 +157,9 @@ class RealtimeDataIngest:
                     "journey_date",
                 ]
             )
-            date = datetime.now().strftime("%Y%m%d")
-
-            # iterate over each bus in 'packet'
-            for bus in np.arange(0, num_buses):
-
-                trip_id = packet[bus].vehicle.trip.trip_id
-
-                # only accept buses with valid trip_id
-                if trip_id != "":
-                    time_ingress = int(time.time())
-                    time_transpond = packet[bus].vehicle.timestamp
-                    bus_id = packet[bus].vehicle.vehicle.id
-
-                    route_id = packet[bus].vehicle.trip.route_id
-                    current_stop = packet[
-                        bus
-                    ].vehicle.current_stop_sequence  # noqa: E501
-                    latitude = packet[bus].vehicle.position.latitude
-                    longitude = packet[bus].vehicle.position.longitude
-                    bearing = packet[bus].vehicle.position.bearing
-
-                    bus_update = [
-                        time_ingress,
-                        time_transpond,
-                        bus_id,
-                        trip_id,
-                        route_id,
-                        current_stop,
-                        latitude,
-                        longitude,
-                        bearing,
-                        date,
-                    ]
-
-                    csv_obj.writerow(bus_update)
-
-                else:
-                    pass
-
-            csv_file.close()
+            date = now.strftime("%Y%m%d")
+            time_ingress = int(now.timestamp())
+
+            csv_obj.writerows(_bus_updates(packet, time_ingress, date))
 
         return None
@@ -5,8 +5,9 @@ import naptan
 import os
 import pandas as pd
 import requests
-import toml
+import threading
 from datetime import datetime
+from src.bus_metrics.setup.ingest_config import load_ingest_toml
 
 
 class StaticDataIngest:
@@ -48,7 +49,7 @@ class StaticDataIngest:
         self,
         naptan_filename: str = "data/resources/gb_stops.csv",
     ):
-        self.config = toml.load("src/bus_metrics/setup/ingest.toml")
+        self.config = load_ingest_toml()
         self.naptan_filename = naptan_filename
         self.geography = self.config["geography"]
         self.region = self.config["region_to_analyse"]
@@ -56,6 +57,9 @@ class StaticDataIngest:
         self.geoportal_query_params = self.config["geoportal_query_params"]
         self.boundaries = self.config["boundaries"]
         self.zip_fp_root: str = "data/timetable"
+        # pooled connections, reused across pages and downloads; one
+        # session per thread as requests.Session is not thread-safe
+        self._local = threading.local()
 
     def import_stops_from_naptan(self, filename: str = None) -> None:
         """Import and store NAPTAN stops data.
@@ -85,13 +89,35 @@ class StaticDataIngest:
 
         return None
 
-    def _connect_to_endpoint(self, url: str) -> dict | Exception:
+    def _get_session(self) -> requests.Session:
+        """Return this thread's session, creating it on first use.
+
+        Returns
+        -------
+        session: requests.Session
+            Pooled HTTP session owned by the calling thread
+
+        """
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+
+        return session
+
+    def _connect_to_endpoint(
+        self, url: str, params: dict = None, stream: bool = False
+    ) -> dict | Exception:
         """Diagnose successful connection to site.
 
         Parameters
         ----------
         url: str
             API endpoint
+        params: dict, optional
+            Query parameters, defaults to geoportal_query_params
+        stream: bool, optional
+            Defer downloading the response body until it is read
 
         Returns
         -------
@@ -106,7 +132,11 @@ class StaticDataIngest:
         """
         if url is None:
             url = self.boundaries[self.geography]["url"]
-        response = requests.get(url, params=self.geoportal_query_params)
+        if params is None:
+            params = self.geoportal_query_params
+        response = self._get_session().get(
+            url, params=params, stream=stream
+        )
 
         if response.ok:
             return response
@@ -164,10 +194,11 @@ class StaticDataIngest:
             filename = self.boundaries[self.geography]["filename"]
 
         if not os.path.exists(filename):
-            query_params = self.geoportal_query_params
-            response = self._connect_to_endpoint(url)
+            # copy, so paging never leaks an offset into later calls
+            query_params = dict(self.geoportal_query_params)
+            response = self._connect_to_endpoint(url, query_params)
             content = response.json()
-            gdf = self._extract_geodata(content)
+            pages = [self._extract_geodata(content)]
 
             # if transfer limit element exists, continue to call
             # until all rows ingested
@@ -175,14 +206,13 @@ class StaticDataIngest:
             try:
                 # GeoPortal transfer limit
                 more_pages = content["properties"]["exceededTransferLimit"]
-                offset = len(gdf)  # rows in initial cut
+                offset = len(pages[0])  # rows in initial cut
 
                 while more_pages:
                     query_params["resultOffset"] += offset
-                    response = self._connect_to_endpoint(url)
+                    response = self._connect_to_endpoint(url, query_params)
                     content = response.json()
-                    add_gdf = self._extract_geodata(content)
-                    gdf = pd.concat([gdf, add_gdf])
+                    pages.append(self._extract_geodata(content))
 
                     # test if further rows beyond limit are
                     # yet to be downloaded
@@ -196,7 +226,9 @@ class StaticDataIngest:
             except KeyError:
                 pass
 
-            gdf = gdf.reset_index(drop=True)
+            # concatenate once, rather than copying all prior pages
+            # on every call
+            gdf = pd.concat(pages, ignore_index=True)
             gdf.to_file(filename, driver="GeoJSON")
 
         else:
@@ -229,10 +261,11 @@ class StaticDataIngest:
             filename = f"{self.zip_fp_root}/{region}_{date}.zip"
 
         if not os.path.exists(filename):
-            r = self._connect_to_endpoint(url)
-
-            with open(filename, "wb") as f:
-                f.write(r.content)
+            # stream the zip to disk rather than holding it in memory
+            with self._connect_to_endpoint(url, stream=True) as r:
+                with open(filename, "wb") as f:
+                    for chunk in r.iter_content(chunk_size=1 << 20):
+                        f.write(chunk)
 
         else:
             raise FileExistsError(
@@ -1,7 +1,7 @@
 """Tests for punctuality_rate module."""
 
 import pytest
-import pandas as pd
+import polars as pl
 from datetime import datetime
 from src.bus_metrics.aggregation.punctuality_rate import AggregationTool
 
@@ -22,8 +22,9 @@ def test_merge_geographies_with_stop_punctuality(aggregation_tool):
     )
     result = aggregation_tool.merge_geographies_with_stop_punctuality()
     expected_dims = (3, 15)
-    # test: output is dataframe
-    assert isinstance(result, pd.DataFrame)
+    # test: output is lazy dataframe
+    assert isinstance(result, pl.LazyFrame)
+    result = result.collect()
     # test: output dims (more secure than changeable geog versions)
     assert result.shape == expected_dims
 
@@ -41,13 +42,13 @@ def test_reaggregate_punctuality(aggregation_tool):
     """Test correct reaggregation of punctuality by geography."""
     aggregation_tool.code = "LSOA21CD"
     aggregation_tool.name = "LSOA21NM"
-    labelled = pd.DataFrame(
+    labelled = pl.DataFrame(
         {
-            "stop_id": [1, 2, 3],
-            "service_stops": [10, 20, 30],
-            "punctuality_rate": [0.8, 0.9, 0.7],
-            aggregation_tool.name: ["A", "B", "A"],
-            aggregation_tool.code: ["1", "2", "1"],
+            "stop_id": [1, 2, 3, 4],
+            "service_stops": [10, 20, 30, 40],
+            "punctuality_rate": [0.8, 0.9, 0.7, 0.5],
+            aggregation_tool.name: ["A", "B", "A", None],
+            aggregation_tool.code: ["1", "2", "1", None],
         }
     )
     expected_columns = [
@@ -61,11 +62,14 @@ def test_reaggregate_punctuality(aggregation_tool):
 
     result = aggregation_tool._reaggregate_punctuality(labelled)
     # test: correct format
-    assert isinstance(result, pd.DataFrame)
+    assert isinstance(result, pl.LazyFrame)
+    result = result.collect()
     # test: correct columns
-    assert list(result.columns) == expected_columns
+    assert result.columns == expected_columns
     # test: correct output values
-    assert result.values.tolist() == expected_data
+    assert [list(row) for row in result.rows()] == expected_data
+    # test: unlabelled stops excluded rather than grouped as null
+    assert result[aggregation_tool.code].null_count() == 0
 
 
 # note use of mocker from pytest-mock
@@ -78,15 +82,15 @@ def test_punctuality_by_geography(aggregation_tool, mocker, tmp_path):
     mocker.patch.object(
         aggregation_tool,
         "merge_geographies_with_stop_punctuality",
-        return_value=pd.DataFrame(),
+        return_value=pl.LazyFrame(),
     )
     mocker.patch.object(
         aggregation_tool,
         "_reaggregate_punctuality",
-        return_value=pd.DataFrame(),
+        return_value=pl.LazyFrame(),
     )
     result = aggregation_tool.punctuality_by_geography()
     # test: correct format
-    assert isinstance(result, pd.DataFrame)
+    assert isinstance(result, pl.DataFrame)
     # test: csv stored correctly
     assert temp_file.is_file()
@@ -1,4 +1,5 @@
 """Tests for Schedule_builder class."""
+import os
 import polars as pl
 
 pytest_plugins = ["tests.aggregation.test_fixtures"]
@@ -24,6 +25,28 @@ def test_build_timetable_func(stops_test, test_class_instantiate, config):
     ), "Timetable Data not read in."
 
 
+def test_build_timetable_cached(stops_test, test_class_instantiate, config):
+    """Check a built timetable is cached to parquet and reused."""
+    test_stops = pl.read_csv(
+        stops_test,
+        ignore_errors=True,
+        dtypes={"stop_id": pl.Utf8},  # noqa: E501
+    )
+
+    test_stops = test_stops[["ATCOCode", "Latitude", "Longitude"]]
+    test_stops.columns = ["stop_id", "stop_lat", "stop_lon"]
+    first = test_class_instantiate.build_timetable(
+        stops=test_stops, region=config["region"], date=config["date"]
+    )
+    cached = os.listdir(test_class_instantiate.timetable_cache_dir)
+    assert len(cached) == 1
+    second = test_class_instantiate.build_timetable(
+        stops=test_stops, region=config["region"], date=config["date"]
+    )
+    assert second.shape == first.shape
+    assert second["UID"].to_list() == first["UID"].to_list()
+
+
 def test_load_raw_realtime_data(test_class_instantiate, config):
     """PROPOSED UNIT TEST: Simple test to check loading of realtime data."""
     test_region = config["region"]
@@ -32,7 +55,18 @@ def test_load_raw_realtime_data(test_class_instantiate, config):
     real_df = test_class_instantiate.load_raw_realtime_data(
         test_region, test_date
     )
-    assert type(real_df) == pl.DataFrame
+    assert type(real_df) == pl.LazyFrame
+    assert type(real_df.collect()) == pl.DataFrame
+
+
+def test_load_raw_realtime_data_empty(test_class_instantiate, tmp_path):
+    """Check an empty frame is returned when no realtime data exists."""
+    test_class_instantiate.realtime_dir = tmp_path
+    real_df = test_class_instantiate.load_raw_realtime_data(
+        "north_east", "19700101"
+    ).collect()
+    assert real_df.shape == (0, 10)
+    assert real_df["route_id"].dtype == pl.Utf8
 
 
 def test_split_realtime_data(test_class_instantiate):
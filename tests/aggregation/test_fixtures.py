@@ -76,10 +76,9 @@ def test_real_path(tmp_path_factory):
 
     """
     real_path = tmp_path_factory.mktemp("real")
-    scriptStartTime = datetime.now()
-    scriptStartTimeUnix = time.mktime(scriptStartTime.timetuple())
+    deadline = time.monotonic() + 30
 
-    while time.mktime(datetime.now().timetuple()) < scriptStartTimeUnix + 30:
+    while time.monotonic() < deadline:
         try:
             rtool.api_call()
             fileTimeStamp = datetime.now().strftime("%Y%m%d-%H:%M:%S")
@@ -151,6 +150,7 @@ def test_class_instantiate(config, test_gtfs_path, test_real_path):
 
     builder = Schedule_Builder(**class_input)
     builder.timetable_dir = test_gtfs_path
+    builder.timetable_cache_dir = os.path.join(test_gtfs_path, "cache")
     builder.realtime_dir = test_real_path
 
     return builder
@@ -6,8 +6,14 @@ from datetime import datetime
 from src.bus_metrics.aggregation.preprocessing import (
     unzip_GTFS,
     polars_robust_load_csv,
+    polars_robust_scan_csv,
+    polars_load_csv_with_schema,
     convert_unix_to_time_string,
+    convert_string_time_to_unix,
+    convert_SINGLE_datetime_to_unix,
     build_stops,
+    build_uid,
+    deduplicate,
 )
 
 pytest_plugins = ["tests.aggregation.test_fixtures"]
@@ -87,6 +93,20 @@ def test_no_zips(tmp_path):
         unzip_GTFS(tmp_path, tmp_path, ".zip", None)
 
 
+def test_deduplicate():
+    """Test repeated pings are reduced to their latest ingest."""
+    sample_df = pl.read_csv("tests/data/north_east_20240221-SAMPLE.csv")
+    repeat = sample_df.head(1).with_columns(
+        pl.col("time_ingest") + 10, pl.col("current_stop") + 1
+    )
+    df = deduplicate(pl.concat([sample_df, repeat]))
+    assert df.shape == (6, 10)
+    assert (
+        df.filter(pl.col("bus_id") == repeat["bus_id"][0])["time_ingest"][0]
+        == repeat["time_ingest"][0]
+    )
+
+
 def test_robust_load_csv():
     """Simple test to check loading of csv with polars."""
     # Test case when dtypes is None
@@ -105,6 +125,43 @@ def test_polars_dtypes():
     assert df["route_id"].dtype == pl.Utf8
 
 
+def test_robust_scan_csv():
+    """Simple test to check lazy scanning of csv with polars."""
+    test_csv = "tests/data/north_east_20240221-SAMPLE.csv"
+    lf = polars_robust_scan_csv(test_csv, dtypes={"route_id": pl.Utf8})
+    assert isinstance(lf, pl.LazyFrame)
+    df = lf.collect()
+    assert df.shape == (6, 10)
+    assert df["route_id"].dtype == pl.Utf8
+
+
+def test_load_csv_with_schema():
+    """Test declared dtypes applied and undeclared columns left as str."""
+    test_csv = "tests/data/north_east_20240221-SAMPLE.csv"
+    schema = {
+        "time_transpond": pl.Int64,
+        "current_stop": pl.UInt32,
+        "not_a_column": pl.Utf8,
+    }
+    df = polars_load_csv_with_schema(test_csv, schema)
+    assert df.shape == (6, 10)
+    assert df["time_transpond"].dtype == pl.Int64
+    assert df["current_stop"].dtype == pl.UInt32
+    assert df["route_id"].dtype == pl.Utf8
+    assert "not_a_column" not in df.columns
+
+
+def test_load_csv_with_schema_columns():
+    """Test only requested columns present in the file are parsed."""
+    test_csv = "tests/data/north_east_20240221-SAMPLE.csv"
+    schema = {"time_transpond": pl.Int64}
+    df = polars_load_csv_with_schema(
+        test_csv, schema, columns=["trip_id", "time_transpond", "missing"]
+    )
+    assert sorted(df.columns) == ["time_transpond", "trip_id"]
+    assert df["time_transpond"].dtype == pl.Int64
+
+
 def test_convert_unix_to_time_string():
     """Test to check conversion of unix timestamp to string."""
     # Read in sample csv
@@ -140,12 +197,95 @@ def test_convert_unix_to_time_string():
     )
 
 
-def test_build_stops():
+def test_convert_string_time_to_unix():
+    """Test local time strings convert to UTC unix timestamps."""
+    df = pl.DataFrame(
+        {
+            "timetable_date": ["20240221", "20240701"],
+            "arrival_time": ["11:37:06", "08:00:00"],
+        }
+    )
+    df_result = convert_string_time_to_unix(df, "arrival_time")
+    # test: GMT in winter, BST (UTC+1) in summer
+    assert df_result["unix_arrival_time"].to_list() == [
+        1708515426,
+        1719817200,
+    ]
+
+
+def test_convert_string_time_to_unix_fixed_date():
+    """Test a shared date is used and times past midnight roll over."""
+    df = pl.DataFrame({"arrival_time": ["11:37:06", "24:30:00"]})
+    df_result = convert_string_time_to_unix(
+        df, "arrival_time", date="20240221"
+    )
+    assert df_result["unix_arrival_time"].to_list() == [
+        1708515426,
+        1708561800,
+    ]
+
+
+def test_convert_SINGLE_datetime_to_unix():
+    """Test dates convert to unix timestamps at London midnight."""
+    # test: GMT in winter, BST (UTC+1) in summer
+    assert convert_SINGLE_datetime_to_unix("20240221") == 1708473600
+    assert convert_SINGLE_datetime_to_unix("20240701") == 1719788400
+
+
+def test_build_stops(tmp_path):
     """Simple test checking processed stops data."""
     output = build_stops(
-        output="polars", stops_data="tests/data/stops_sample.csv"
+        output="polars",
+        stops_data="tests/data/stops_sample.csv",
+        cache_path=os.path.join(tmp_path, "stops.parquet"),
     )
     assert type(output) == pl.DataFrame
     assert output.columns == ["stop_id", "stop_lat", "stop_lon"]
     assert output[0, "stop_lat"] == 51.44902101682718
     assert output[0, "stop_lon"] == -2.5857890312830363
+
+
+def test_build_stops_cached(tmp_path):
+    """Test converted stops are cached and reused."""
+    cache_path = os.path.join(tmp_path, "stops.parquet")
+    first = build_stops(
+        stops_data="tests/data/stops_sample.csv", cache_path=cache_path
+    )
+    # test: parquet cache written on first build
+    assert os.path.exists(cache_path)
+    second = build_stops(
+        stops_data="tests/data/stops_sample.csv", cache_path=cache_path
+    )
+    # test: cached stops match the freshly converted stops
+    assert second.rows() == first.rows()
+
+
+def test_build_uid():
+    """Test timetable and realtime identifiers match across dtypes."""
+    tt = pl.DataFrame(
+        {
+            "timetable_date": ["20240221", "20240221"],
+            "stop_sequence": [1, 2],
+            "trip_id": ["VJ1", "VJ1"],
+            "route_id": ["7454", "7454"],
+        }
+    )
+    rt = pl.DataFrame(
+        {
+            "journey_date": [20240221],
+            "current_stop": [2],
+            "trip_id": ["VJ1"],
+            "route_id": ["7454"],
+        }
+    )
+    tt = tt.with_columns(
+        build_uid("timetable_date", "stop_sequence", "trip_id", "route_id")
+    )
+    rt = rt.with_columns(
+        build_uid("journey_date", "current_stop", "trip_id", "route_id")
+    )
+    assert tt["UID"].dtype == pl.UInt64
+    # test: distinct service stops hash differently
+    assert tt["UID"].n_unique() == 2
+    # test: same service stop matches between timetable and realtime
+    assert rt["UID"][0] == tt["UID"][1]